@@ -22,6 +22,12 @@ data "aws_iam_policy_document" "sfn_role" {
     actions   = ["lambda:InvokeFunction"]
     resources = [module.csv-to-parquet-export.lambda_function_arn]
   }
+
+  # Poll S3 Batch Operations jobs submitted when overwriting large tables
+  statement {
+    actions   = ["s3:DescribeJob"]
+    resources = ["arn:aws:s3:${data.aws_region.current.id}:${data.aws_caller_identity.current.account_id}:job/*"]
+  }
 }
 resource "aws_iam_role_policy" "sfn_role" {
   role   = aws_iam_role.state_machine.id
@@ -49,3 +55,47 @@ resource "aws_iam_role_policy" "lambda_kms" {
   role   = module.csv-to-parquet-export.lambda_role_name
   policy = data.aws_iam_policy_document.lambda_kms.json
 }
+
+# S3 Batch Operations role used to tag overwritten parquet objects for expiry
+resource "aws_iam_role" "s3_batch_operations" {
+  name = "${var.name}-s3-batch-operations"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action = "sts:AssumeRole"
+        Effect = "Allow"
+        Principal = {
+          Service = "batchoperations.s3.amazonaws.com"
+        }
+      }
+    ]
+  })
+
+  tags = var.tags
+}
+
+data "aws_iam_policy_document" "s3_batch_operations" {
+  statement {
+    sid = "TagOutputObjects"
+    actions = [
+      "s3:GetObject", "s3:GetObjectVersion", "s3:GetObjectTagging",
+      "s3:PutObjectTagging", "s3:PutObjectVersionTagging"
+    ]
+    resources = ["${module.s3_concept_data_output_bucket.bucket.arn}/*"]
+  }
+
+  statement {
+    sid = "GenerateManifest"
+    actions = [
+      "s3:ListBucket", "s3:GetBucketLocation", "s3:PutInventoryConfiguration"
+    ]
+    resources = [module.s3_concept_data_output_bucket.bucket.arn]
+  }
+}
+
+resource "aws_iam_role_policy" "s3_batch_operations" {
+  role   = aws_iam_role.s3_batch_operations.id
+  policy = data.aws_iam_policy_document.s3_batch_operations.json
+}
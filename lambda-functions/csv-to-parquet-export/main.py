@@ -1,9 +1,28 @@
+import codecs
+import csv
+import io
+import itertools
 import os
 import re
 import logging
+import threading
+import uuid
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import boto3
+import chardet
+from botocore.config import Config
 import awswrangler as wr
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.fs as pa_fs
 from awswrangler.exceptions import AlreadyExists
 
 logger = logging.getLogger()
@@ -18,7 +37,91 @@ TABLE_NAMING = os.getenv(
     "TABLE_NAMING", "use_full_filename"
 ).lower()  # "use_full_filename" or "split_at_last_underscore"
 
-s3 = boto3.client("s3")
+# Prefixes with more objects than this are expired by an S3 Batch Operations
+# tagging job plus the output bucket's lifecycle rule, rather than deleted inline
+BATCH_DELETE_THRESHOLD = 10_000
+# Concurrent delete_objects calls; S3 allows 3,500 deletes/s per prefix
+DELETE_WORKERS = 16
+# Partition sub-prefixes listed concurrently when clearing a table prefix
+LIST_WORKERS = 8
+# Pinned so a change in client defaults can't silently shrink pages
+LIST_PAGINATION = {"PageSize": 1000}
+BATCH_OPERATIONS_ROLE_ARN = os.getenv("BATCH_OPERATIONS_ROLE_ARN")
+ACCOUNT_ID = os.getenv("ACCOUNT_ID")
+EXPIRE_TAG_KEY = "csv-to-parquet-expired"  # matched by the lifecycle rule in s3.tf
+
+# Bytes fetched from the head of the CSV for encoding/delimiter sniffing
+SNIFF_SAMPLE_BYTES = 64 * 1024
+CSV_BLOCK_SIZE = 16 << 20  # 16 MiB per Arrow parse block
+PARQUET_MAX_ROWS_PER_FILE = 500_000
+
+# Below this chardet confidence we assume Windows-1252, the usual culprit
+CHARDET_MIN_CONFIDENCE = 0.5
+# Tried in turn when the sniffed encoding fails past the sample. latin-1 maps
+# every byte, so the last one cannot fail on decoding.
+FALLBACK_ENCODINGS = ("cp1252", "iso-8859-1")
+
+# Columns with more non-null cells than this are typed from a random sample
+INFER_SAMPLE_THRESHOLD = 50_000
+INFER_SAMPLE_SIZE = 20_000
+
+_NON_GLUE_CHAR = re.compile(r"[^a-zA-Z0-9_]")
+
+_TRUTHY = {"true", "t", "yes", "y", "1"}
+_FALSY = {"false", "f", "no", "n", "0"}
+_BOOL_MAP = {v: True for v in _TRUTHY} | {v: False for v in _FALSY}
+_BOOL_RE = re.compile("|".join(sorted(_BOOL_MAP)))  # used with fullmatch
+
+# Tried in order by _detect_datetime_format; day-first wins ambiguous dates
+_DATE_FMTS = (
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%m/%d/%Y",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y%m%d%H%M%S",
+)
+
+# Column kinds chosen by _infer_kind and the pandas dtype each converts to
+_PANDAS_DTYPES = {
+    # Arrow-backed, so text stays in Arrow buffers from read to parquet write
+    "string": pd.ArrowDtype(pa.string()),
+    "boolean": "boolean",
+    "datetime": "datetime64[ns]",
+    "int": "Int64",
+    "float": "float64",
+}
+
+# Glue column types an existing table may have, as the Arrow type new data is
+# cast to; varchar/char(n) and decimal(p,s) are handled in _athena_to_arrow
+_ATHENA_TO_ARROW = {
+    "string": pa.string(),
+    "boolean": pa.bool_(),
+    "tinyint": pa.int8(),
+    "smallint": pa.int16(),
+    "int": pa.int32(),
+    "integer": pa.int32(),
+    "bigint": pa.int64(),
+    "float": pa.float32(),
+    "double": pa.float64(),
+    "date": pa.date32(),
+    "timestamp": pa.timestamp("ns"),  # coerced to ms on write like the rest
+}
+
+# Pool sized above DELETE_WORKERS so concurrent deletes never queue for a
+# connection; adaptive retries back off on S3 SlowDown throttling
+_BOTO_CFG = Config(
+    max_pool_connections=50,
+    retries={"mode": "adaptive", "max_attempts": 10},
+    tcp_keepalive=True,
+    s3={"use_accelerate_endpoint": False, "addressing_style": "virtual"},
+)
+
+s3 = boto3.client("s3", config=_BOTO_CFG)
+s3control = boto3.client("s3control")
+# Arrow's native C++ S3 client for CSV reads and parquet writes: no fsspec/s3fs
+# Python callbacks, so no GIL convoy. Shared across warm invocations.
+_PA_FS = pa_fs.S3FileSystem(region=os.getenv("AWS_REGION"))
 
 
 def derive_table_name(s3_key: str) -> str:
@@ -105,127 +208,933 @@ def ensure_database(db_name: str):
         pass  # safe to ignore if a concurrent create sneaks through
 
 
-def _delete_prefix(bucket: str, prefix: str):
-    """Delete all objects under s3://bucket/prefix (non-versioned buckets)."""
+def _submit_expire_job(bucket: str, prefix: str, created_before: datetime) -> str:
+    """
+    Tag every object under s3://bucket/prefix for lifecycle expiry with an
+    S3 Batch Operations job (Batch Operations has no delete operation).
+    Objects created from created_before on, i.e. the new parquet files, are
+    excluded.
+    """
+    response = s3control.create_job(
+        AccountId=ACCOUNT_ID,
+        ConfirmationRequired=False,
+        Operation={
+            "S3PutObjectTagging": {
+                "TagSet": [{"Key": EXPIRE_TAG_KEY, "Value": "true"}],
+            }
+        },
+        ManifestGenerator={
+            "S3JobManifestGenerator": {
+                "SourceBucket": f"arn:aws:s3:::{bucket}",
+                "EnableManifestOutput": False,
+                "Filter": {
+                    "CreatedBefore": created_before,
+                    "KeyNameConstraint": {"MatchAnyPrefix": [prefix]},
+                },
+            }
+        },
+        Report={"Enabled": False},
+        Priority=10,
+        RoleArn=BATCH_OPERATIONS_ROLE_ARN,
+        ClientRequestToken=str(uuid.uuid4()),
+        Description=f"Expire s3://{bucket}/{prefix}"[:256],
+    )
+    return response["JobId"]
+
+
+def _list_partition_prefixes(bucket: str, prefix: str) -> tuple[list[str], list]:
+    """
+    One delimited listing of s3://bucket/prefix: the hive partition
+    sub-prefixes (extraction_timestamp=.../) plus any keys directly under it.
+    """
     paginator = s3.get_paginator("list_objects_v2")
-    to_delete = {"Objects": []}
-    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
-        for obj in page.get("Contents", []):
-            to_delete["Objects"].append({"Key": obj["Key"]})
-            if len(to_delete["Objects"]) == 1000:
-                s3.delete_objects(Bucket=bucket, Delete=to_delete)
-                to_delete = {"Objects": []}
-    if to_delete["Objects"]:
-        s3.delete_objects(Bucket=bucket, Delete=to_delete)
+    sub_prefixes, keys = [], []
+    for page in paginator.paginate(
+        Bucket=bucket, Prefix=prefix, Delimiter="/", PaginationConfig=LIST_PAGINATION
+    ):
+        sub_prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+        keys.extend(page.get("Contents", []))
+    return sub_prefixes, keys
 
 
-def _deduplicate_columns(df: pd.DataFrame) -> pd.DataFrame:
+def _delete_prefix(
+    bucket: str,
+    prefix: str,
+    *,
+    keep_prefix: str | None = None,
+    created_before: datetime | None = None,
+) -> str | None:
+    """
+    Delete the objects under s3://bucket/prefix (current versions) created
+    before created_before (default now), except the partition sub-prefix
+    keep_prefix. Newer objects belong to loads that started later.
+    Each partition sub-prefix is listed in its own thread and 1000-key
+    batches are deleted concurrently while listing continues.
+    Prefixes above BATCH_DELETE_THRESHOLD objects are handed to S3 Batch
+    Operations instead, with the same cutoff; the job id is returned so the
+    caller can poll it.
+    """
+    created_before = created_before or datetime.now(timezone.utc)
+    paginator = s3.get_paginator("list_objects_v2")
+    sub_prefixes, top_level = _list_partition_prefixes(bucket, prefix)
+    sub_prefixes = [p for p in sub_prefixes if p != keep_prefix]
+    top_level_keys = [
+        {"Key": obj["Key"]} for obj in top_level if obj["LastModified"] < created_before
+    ]
+
+    listed = len(top_level_keys)
+    listed_lock = threading.Lock()
+    too_many = threading.Event()
+
+    with ThreadPoolExecutor(max_workers=DELETE_WORKERS) as deleter:
+        futures = []
+
+        def submit_delete(batch: list):
+            futures.append(
+                deleter.submit(
+                    s3.delete_objects, Bucket=bucket, Delete={"Objects": batch}
+                )
+            )
+
+        def drain(sub_prefix: str):
+            nonlocal listed
+            batch = []
+            for page in paginator.paginate(
+                Bucket=bucket, Prefix=sub_prefix, PaginationConfig=LIST_PAGINATION
+            ):
+                contents = page.get("Contents", [])
+                with listed_lock:
+                    listed += len(contents)
+                    if BATCH_OPERATIONS_ROLE_ARN and listed > BATCH_DELETE_THRESHOLD:
+                        too_many.set()
+                if too_many.is_set():
+                    return
+                for obj in contents:
+                    if obj["LastModified"] >= created_before:
+                        continue
+                    batch.append({"Key": obj["Key"]})
+                    if len(batch) == 1000:
+                        submit_delete(batch)
+                        batch = []  # new list, the submitted one is owned by its future
+            if batch:
+                submit_delete(batch)
+
+        if BATCH_OPERATIONS_ROLE_ARN and listed > BATCH_DELETE_THRESHOLD:
+            too_many.set()
+        else:
+            for i in range(0, len(top_level_keys), 1000):
+                submit_delete(top_level_keys[i : i + 1000])
+            with ThreadPoolExecutor(
+                max_workers=max(1, min(LIST_WORKERS, len(sub_prefixes)))
+            ) as lister:
+                list(lister.map(drain, sub_prefixes))
+
+        if too_many.is_set():
+            # Anything already deleted simply drops out of the job manifest;
+            # leaving the with-block waits for the in-flight batches
+            job_id = _submit_expire_job(bucket, prefix, created_before)
+            logger.info(
+                f"More than {BATCH_DELETE_THRESHOLD} objects under s3://{bucket}/{prefix}, "
+                f"submitted S3 Batch Operations job {job_id}"
+            )
+            return job_id
+
+        # Surface the first failure rather than dropping it
+        for f in futures:
+            f.result()
+    return None
+
+
+def _delete_stale_data(request: dict) -> dict:
+    """
+    Remove an overwritten table's old partitions once the new one is live.
+    Runs as its own state machine step so the delete is off the load's
+    critical path; the recreated Glue table only has the new partition, so
+    Athena never sees the stale objects in the meantime.
+    """
+    delete_job_id = _delete_prefix(
+        request["bucket"],
+        request["prefix"],
+        keep_prefix=request["keep_prefix"],
+        created_before=datetime.fromisoformat(request["created_before"]),
+    )
+    return {"delete_job_id": delete_job_id}
+
+
+def _deduplicate_columns(names: list[str]) -> list[str]:
     """
     Ensure all column names are unique and Glue-safe.
     If duplicates exist after sanitization, suffix with _1, _2, ...
     """
     seen = {}
     new_cols = []
-    for col in df.columns:
-        base = re.sub(r"[^a-zA-Z0-9_]", "_", col).lower().strip("_")
+    for col in names:
+        if col.isascii() and col.replace("_", "a").isalnum():
+            base = col.lower().strip("_")  # already Glue-safe, skip the regex
+        else:
+            base = _NON_GLUE_CHAR.sub("_", col).lower().strip("_")
         if base in seen:
             seen[base] += 1
             new_cols.append(f"{base}_{seen[base]}")
         else:
             seen[base] = 0
             new_cols.append(base)
-    df.columns = new_cols
-    return df
+    return new_cols
 
 
-def _clean_nbsp_and_strip(df: pd.DataFrame) -> pd.DataFrame:
+def _is_arrow_string(dtype: pa.DataType) -> bool:
+    return pa.types.is_string(dtype) or pa.types.is_large_string(dtype)
+
+
+def _string_columns(df: pd.DataFrame) -> list[str]:
+    """Columns holding text: object, pandas string or Arrow string dtypes."""
+    cols = []
+    for c, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.ArrowDtype):
+            if _is_arrow_string(dtype.pyarrow_dtype):
+                cols.append(c)
+        elif dtype == object or isinstance(dtype, pd.StringDtype):
+            cols.append(c)
+    return cols
+
+
+def _clean_nbsp_and_strip(table: pa.Table) -> pa.Table:
     # Normalize headers
-    df.columns = [c.replace("\u00a0", " ").strip() for c in df.columns]
-    # Normalize string/object cells
-    obj_cols = df.select_dtypes(include=["object"]).columns
-    for c in obj_cols:
-        df[c] = df[c].map(
-            lambda x: x.replace("\u00a0", " ").strip() if isinstance(x, str) else x
+    table = table.rename_columns(
+        [c.replace("\u00a0", " ").strip() for c in table.column_names]
+    )
+    # Normalize string cells with Arrow compute kernels, before pandas sees them
+    for i, field in enumerate(table.schema):
+        if _is_arrow_string(field.type):
+            col = pc.replace_substring(table.column(i), "\u00a0", " ")
+            table = table.set_column(i, field.name, pc.utf8_trim_whitespace(col))
+    return table
+
+
+def _read_sample(bucket: str, key: str) -> bytes:
+    """Fetch the first SNIFF_SAMPLE_BYTES of s3://bucket/key with a ranged GET."""
+    return s3.get_object(
+        Bucket=bucket, Key=key, Range=f"bytes=0-{SNIFF_SAMPLE_BYTES - 1}"
+    )["Body"].read()
+
+
+def _sniff_encoding(sample: bytes, explicit: str | None = None) -> str:
+    """
+    Pick an encoding from the sample: explicit > BOM > utf-8 > chardet.
+    """
+    if explicit:
+        return explicit
+
+    if sample.startswith(codecs.BOM_UTF8):
+        return "utf-8-sig"
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+
+    try:
+        # final=False tolerates a multi-byte character cut off by the range
+        codecs.getincrementaldecoder("utf-8")().decode(sample, final=False)
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+
+    detected = chardet.detect(sample)
+    if not detected["encoding"] or detected["confidence"] < CHARDET_MIN_CONFIDENCE:
+        return "cp1252"
+    return detected["encoding"]
+
+
+def _decode_sample(sample: bytes, encoding: str) -> str:
+    """Decode the sample, dropping the (probably truncated) last line."""
+    text = codecs.getincrementaldecoder(encoding)(errors="ignore").decode(sample)
+    if "\n" in text:
+        text = text[: text.rindex("\n")]
+    return text
+
+
+def _sniff_delimiter(text: str) -> str:
+    """
+    Sniff the delimiter from the sample. Falls back to a comma if ambiguous.
+    """
+    try:
+        return csv.Sniffer().sniff(text, delimiters=",;\t|").delimiter
+    except csv.Error:
+        return ","
+
+
+def _sniff_header(text: str, delimiter: str) -> list[str]:
+    """Column names from the first record, the ones Arrow is told to use."""
+    # An explicit utf-8 (rather than utf-8-sig) keeps the BOM in the text
+    text = text.removeprefix("\ufeff")
+    return next(csv.reader(io.StringIO(text), delimiter=delimiter), [])
+
+
+def _invalid_row_handler(
+    short_rows: deque, long_rows: list[int]
+) -> Callable[[pa_csv.InvalidRow], str]:
+    """
+    Arrow rejects any row without exactly one field per column. Keep the text
+    of rows that are short (pandas padded those with NA) for _read_blocks and
+    record the numbers of rows that are long (on_bad_lines="skip" dropped them).
+    """
+
+    def handle(row: pa_csv.InvalidRow) -> str:
+        if row.actual_columns < row.expected_columns:
+            short_rows.append(row.text)
+        else:
+            long_rows.append(row.number)
+        return "skip"
+
+    return handle
+
+
+def _pad_short_rows(rows: list[str], names: list[str], delimiter: str) -> pa.Table:
+    """Parse rows Arrow rejected as short and pad them with nulls."""
+    columns = [[] for _ in names]
+    for text in rows:
+        fields = next(csv.reader([text], delimiter=delimiter), [])
+        for i, column in enumerate(columns):
+            # Empty cells are null, as with strings_can_be_null
+            column.append(fields[i] or None if i < len(fields) else None)
+    return pa.table([pa.array(c, pa.string()) for c in columns], names=names)
+
+
+def _read_blocks(
+    reader: pa_csv.CSVStreamingReader,
+    *,
+    delimiter: str,
+    short_rows: deque,
+    long_rows: list[int],
+) -> Iterator[pa.Table]:
+    """
+    Yield reader's blocks as tables, with the short rows found so far padded
+    and appended (rows are reordered within the file, none are lost).
+    A header-only CSV yields one empty table.
+    """
+    names = reader.schema.names
+    padded = 0
+
+    def drain() -> pa.Table:
+        nonlocal padded
+        # popleft is atomic; Arrow may call the handler from its own threads
+        rows = []
+        while short_rows:
+            rows.append(short_rows.popleft())
+        padded += len(rows)
+        return _pad_short_rows(rows, names, delimiter)
+
+    empty = True
+    for batch in reader:
+        table = pa.Table.from_batches([batch])
+        if short_rows:
+            table = pa.concat_tables([table, drain()])
+        empty = False
+        yield table
+    if short_rows or empty:
+        yield drain()
+
+    if padded:
+        logger.warning(f"Padded {padded} CSV rows with fewer fields than the header")
+    if long_rows:
+        logger.warning(
+            f"Skipped {len(long_rows)} CSV rows with more fields than the header "
+            f"(rows {long_rows[:10]}{'...' if len(long_rows) > 10 else ''})"
         )
-    return df
 
 
-def read_csv_safely(s3_uri: str, explicit_encoding: str | None = None) -> pd.DataFrame:
+def _open_csv_arrow(
+    stream,
+    enc: str,
+    delimiter: str,
+    header: list[str],
+    invalid_row_handler: Callable[[pa_csv.InvalidRow], str],
+) -> pa_csv.CSVStreamingReader:
+    """
+    Open a block-by-block Arrow CSV reader over stream.
+    Every column is read as text: Arrow only infers types from the first
+    block, which later blocks could contradict; _infer_kinds types them instead.
+    The header row is skipped and replaced by header, so the column_types
+    keys always match Arrow's column names.
+    """
+    read_options = pa_csv.ReadOptions(
+        encoding=enc,
+        block_size=CSV_BLOCK_SIZE,
+        column_names=header or None,  # let Arrow fail on an empty file
+        skip_rows=1 if header else 0,
+    )
+    parse_options = pa_csv.ParseOptions(
+        delimiter=delimiter,
+        # Quoted cells may span lines, as the pandas python engine allowed
+        newlines_in_values=True,
+        invalid_row_handler=invalid_row_handler,
+    )
+    convert_options = pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in header},
+        strings_can_be_null=True,
+    )
+    return pa_csv.open_csv(
+        stream,
+        read_options=read_options,
+        parse_options=parse_options,
+        convert_options=convert_options,
+    )
+
+
+def _is_decode_error(e: Exception) -> bool:
+    # Arrow validates UTF-8 itself; other encodings go through Python codecs
+    return isinstance(e, UnicodeDecodeError) or any(
+        m in str(e) for m in ("invalid UTF8", "can't decode")
+    )
+
+
+def _next_fallback_encoding(failed: str) -> str | None:
+    """The encoding to retry with after failed, or None if none are left."""
+    names = [codecs.lookup(e).name for e in FALLBACK_ENCODINGS]
+    failed = codecs.lookup(failed).name
+    later = names[names.index(failed) + 1 :] if failed in names else names
+    return later[0] if later else None
+
+
+class _DecodeFailed(Exception):
+    """The CSV didn't decode as encoding somewhere past the sniffed sample."""
+
+    def __init__(self, message: str, encoding: str):
+        super().__init__(message)
+        self.encoding = encoding
+
+
+@contextmanager
+def open_csv_safely(bucket: str, key: str, explicit_encoding: str | None = None):
     """
-    Try common encodings and let pandas infer the delimiter.
+    Sniff encoding, delimiter and header from the head of the file, then
+    stream it from S3 with Arrow's multithreaded C++ reader (no fsspec/s3fs).
     Prefer an explicit encoding if provided via env/event.
+    Yields an iterator of pa.Table blocks; memory stays at about one block.
+    A decode error in any block, also one raised while the caller is
+    consuming them, is re-raised as _DecodeFailed for a retry.
     """
-    encodings = [explicit_encoding] if explicit_encoding else []
-    encodings += ["utf-8", "utf-8-sig", "cp1252", "iso-8859-1"]
-    tried = []
-    for enc in [e for e in encodings if e]:
-        try:
-            return wr.s3.read_csv(
-                s3_uri,
-                encoding=enc,
-                sep=None,  # sniff delimiter
-                engine="python",
-                dtype_backend="pyarrow",
-                on_bad_lines="skip",
+    sample = _read_sample(bucket, key)
+    enc = _sniff_encoding(sample, explicit_encoding)
+    text = _decode_sample(sample, enc)
+    delimiter = _sniff_delimiter(text)
+    header = _sniff_header(text, delimiter)
+    logger.info(f"Reading s3://{bucket}/{key} as {enc} with delimiter {delimiter!r}")
+
+    short_rows, long_rows = deque(), []
+    handler = _invalid_row_handler(short_rows, long_rows)
+    reader = None
+    stream = _PA_FS.open_input_stream(f"{bucket}/{key}")
+    try:
+        # Opening parses the first block, so decode errors there surface here
+        reader = _open_csv_arrow(stream, enc, delimiter, header, handler)
+        yield _read_blocks(
+            reader, delimiter=delimiter, short_rows=short_rows, long_rows=long_rows
+        )
+    except (UnicodeDecodeError, pa.lib.ArrowInvalid) as e:
+        if not _is_decode_error(e):
+            raise
+        raise _DecodeFailed(
+            f"s3://{bucket}/{key} doesn't decode as {enc}: {e}", enc
+        ) from e
+    finally:
+        # Stops Arrow's read-ahead, which may still be calling handler
+        if reader is not None:
+            reader.close()
+        stream.close()
+
+
+def _detect_datetime_format(probe: pd.Series) -> str | None:
+    """
+    First of _DATE_FMTS that parses >= 90% of probe. Returns "" when only
+    pandas' own format inference does, None when probe isn't datetimes.
+    """
+    for fmt in _DATE_FMTS:
+        dt = pd.to_datetime(probe, format=fmt, errors="coerce", cache=True)
+        if dt.notna().mean() >= 0.9:
+            return fmt
+
+    # Slow path: let pandas infer a format from the first value
+    dt = pd.to_datetime(probe, errors="coerce", utc=False, cache=True)
+    if dt.notna().mean() >= 0.9:
+        return ""
+    return None
+
+
+def _fractional(num: pd.Series) -> np.ndarray:
+    """
+    Mask of the non-null values of a numeric Series that aren't whole numbers.
+    One pass over the float64 buffer instead of dropna -> mod -> ne Series.
+    """
+    arr = num.to_numpy(dtype="float64", na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        frac = np.mod(arr, 1)  # NaN for +/-inf, so those count as fractional
+    return ~((frac == 0) | np.isnan(arr))
+
+
+def _is_all_integral(num: pd.Series) -> bool:
+    """True if every non-null value of a numeric Series is a whole number."""
+    return not _fractional(num).any()
+
+
+def _infer_kind(col: pd.Series) -> tuple[str, str | None]:
+    """
+    Classify a text column as "boolean", "datetime", "int", "float" or "string".
+    Returns (kind, datetime format); the format is None unless kind is datetime.
+    Pure function of one Series so columns can be classified concurrently.
+    """
+    if not col.notna().any():
+        return "string", None
+
+    # Stringify once; every detector below reuses these
+    sample = col.dropna().astype(str).str.strip()
+    lower = sample.str.lower()
+
+    # Cardinality first (hash count in C), then one regex scan; no Python set
+    if lower.nunique() <= 2 and lower.str.fullmatch(_BOOL_RE).all():
+        return "boolean", None
+
+    # Decide the type on a probe
+    if len(sample) > INFER_SAMPLE_THRESHOLD:
+        probe = sample.sample(n=INFER_SAMPLE_SIZE, random_state=0)
+    else:
+        probe = sample
+
+    fmt = _detect_datetime_format(probe)
+    if fmt is not None:
+        return "datetime", fmt
+
+    num = pd.to_numeric(probe.str.replace(",", "", regex=False), errors="coerce")
+    if num.notna().mean() >= 0.9:
+        # Integral-ness is checked on every row, a miss would fail later blocks
+        if probe is not sample:
+            num = pd.to_numeric(
+                sample.str.replace(",", "", regex=False), errors="coerce"
             )
-        except UnicodeDecodeError:
-            tried.append(enc)
-            continue
-    raise UnicodeDecodeError(
-        "csv", b"", 0, 1, f"Failed to decode with encodings tried: {', '.join(tried)}"
-    )
+        return ("int" if _is_all_integral(num) else "float"), None
+
+    return "string", None
+
+
+def _convert_column(
+    col: pd.Series, kind: str, fmt: str | None = None
+) -> tuple[pd.Series, frozenset[str]]:
+    """
+    Convert a text column to the type (and format) _infer_kind chose for it.
+    Also returns the distinct non-blank values that didn't fit (nulled, or
+    fractional in an int column) so _typed_frames can tell if the kind holds.
+    """
+    if kind == "string" and col.dtype == _PANDAS_DTYPES["string"]:
+        return col, frozenset()
+    if kind == "string" or not col.notna().any():
+        return col.astype(_PANDAS_DTYPES[kind]), frozenset()
+
+    sample = col.dropna().astype(str).str.strip()
+
+    if kind == "boolean":
+        converted = sample.str.lower().map(_BOOL_MAP).astype("boolean")
+        misfit = converted.isna().to_numpy()
+    elif kind == "datetime":
+        # Same format for every block, so day/month order can't flip mid-file
+        converted = pd.to_datetime(
+            sample, format=fmt or None, errors="coerce", utc=False, cache=True
+        )
+        misfit = converted.isna().to_numpy()
+    else:
+        converted = pd.to_numeric(
+            sample.str.replace(",", "", regex=False), errors="coerce"
+        )
+        misfit = converted.isna().to_numpy()
+        if kind == "int":
+            frac = _fractional(converted)
+            misfit |= frac
+            converted = converted.mask(frac).astype("Int64")
+        else:
+            converted = converted.astype("float64")
+
+    misfit &= (sample != "").to_numpy()
+    # Null cells in col are missing from converted and come back as NA
+    return converted.reindex(col.index), frozenset(sample[misfit].unique())
 
 
-def _stabilize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+def _widen_kind(
+    kind: str, misfits: frozenset[str], held: frozenset[str] = frozenset()
+) -> str:
     """
-    Make Athena-friendly types:
-    - All-null object columns -> string
+    The kind to retry a column with when values it can't hold turn up.
+    held is what a boolean column held so far: a 0/1 column that later gets
+    a 2 is a number column, as when the whole file was typed at once.
+    """
+    if kind in ("int", "boolean"):
+        values = misfits | held if kind == "boolean" else misfits
+        num = pd.to_numeric(
+            pd.Series(list(values), dtype=object).str.replace(",", "", regex=False),
+            errors="coerce",
+        )
+        if num.notna().all():
+            # Fractions in an int column; numbers are still numbers
+            return "int" if kind == "boolean" and _is_all_integral(num) else "float"
+    return "string"
+
+
+class _ColumnsWidened(Exception):
+    """
+    A later CSV block holds values its first-block column kinds can't.
+    kinds is the widened mapping to reread the whole file with.
+    """
+
+    def __init__(self, kinds: dict[str, tuple[str, str | None]], widened: dict):
+        super().__init__(
+            "Later CSV rows don't fit the types chosen from the first block: "
+            + ", ".join(f"{c} {old} -> {new}" for c, (old, new) in widened.items())
+        )
+        self.kinds = kinds
+
+
+def _column_workers(n_cols: int) -> int:
+    return max(1, min(os.cpu_count() or 1, n_cols))
+
+
+def _infer_kinds(df: pd.DataFrame) -> dict[str, tuple[str, str | None]]:
+    """
+    Pick an Athena-friendly type for each text column:
+    - All-null text columns -> string
     - Low-cardinality boolean-like text -> boolean
     - Parse datetimes when obvious
-    - Otherwise object -> string
+    - Numbers (thousands separators allowed) -> int or float
+    - Otherwise text -> string
+    The pandas/NumPy kernels release the GIL, so columns are classified in threads.
     """
-    obj_cols = df.select_dtypes(include=["object"]).columns
-    for c in obj_cols:
-        col = df[c]
+    str_cols = _string_columns(df)
+    if not str_cols:
+        return {}
 
-        if not col.notna().any():
-            df[c] = col.astype("string")
-            continue
+    with ThreadPoolExecutor(max_workers=_column_workers(len(str_cols))) as ex:
+        return dict(zip(str_cols, ex.map(_infer_kind, (df[c] for c in str_cols))))
 
-        sample = col.dropna().astype(str).str.strip()
-        lower = sample.str.lower()
 
-        truthy = {"true", "t", "yes", "y", "1"}
-        falsy = {"false", "f", "no", "n", "0"}
-        unique_vals = set(lower.unique())
-        if unique_vals.issubset(truthy | falsy) and len(unique_vals) <= 2:
-            df[c] = lower.map(
-                lambda x: True if x in truthy else (False if x in falsy else pd.NA)
-            ).astype("boolean")
-            continue
+def _stabilize_dtypes(
+    df: pd.DataFrame, kinds: dict[str, tuple[str, str | None]]
+) -> dict[str, frozenset[str]]:
+    """
+    Convert the columns in kinds (from _infer_kinds) in threads, in place.
+    Returns each column's misfit values, as from _convert_column.
+    """
+    if not kinds:
+        return {}
 
-        dt = pd.to_datetime(
-            sample, errors="coerce", utc=False, infer_datetime_format=True
-        )
-        if dt.notna().mean() >= 0.9:
-            df[c] = pd.to_datetime(col, errors="coerce")
-            continue
+    cols = list(kinds)
+    with ThreadPoolExecutor(max_workers=_column_workers(len(cols))) as ex:
+        converted = ex.map(lambda c: _convert_column(df[c], *kinds[c]), cols)
+        results = dict(zip(cols, converted))
 
-        num = pd.to_numeric(sample.str.replace(",", ""), errors="coerce")
-        if num.notna().mean() >= 0.9:
-            if (num.dropna() % 1 == 0).all():
-                df[c] = pd.to_numeric(
-                    col.astype(str).str.replace(",", ""), errors="coerce"
-                ).astype("Int64")
-            else:
-                df[c] = pd.to_numeric(
-                    col.astype(str).str.replace(",", ""), errors="coerce"
+    # Assign in place: df.assign deep-copies every column first (pre-CoW pandas)
+    for c, (series, _) in results.items():
+        df[c] = series
+    return {c: misfits for c, (_, misfits) in results.items()}
+
+
+def _typed_frames(
+    tables: Iterator[pa.Table],
+    extraction_timestamp: str,
+    kinds: dict[str, tuple[str, str | None]] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Clean, rename and type each block from tables, with the partition column.
+    Column names and types (unless kinds is given) are decided on the first
+    block and reused after, so every frame has the same schema. The values the
+    first block nulls (placeholders like "N/A") may recur; any other value a
+    later block can't convert raises _ColumnsWidened before that block is
+    yielded.
+    """
+    names = accepted = None
+    held = {}
+    for table in tables:
+        # Clean + normalize while still in Arrow, then convert to pandas once
+        table = _clean_nbsp_and_strip(table)
+        if names is None:
+            names = _deduplicate_columns(table.column_names)
+        table = table.rename_columns(names)
+        df = table.to_pandas(types_mapper=pd.ArrowDtype)
+        if kinds is None:
+            kinds = _infer_kinds(df)
+        if accepted is None:
+            # At most two distinct tokens each, for _widen_kind
+            held = {
+                c: frozenset(df[c].dropna().astype(str).str.strip().str.lower())
+                for c, (kind, _) in kinds.items()
+                if kind == "boolean"
+            }
+        misfits = _stabilize_dtypes(df, kinds)
+        if accepted is None:
+            accepted = misfits
+        else:
+            widened = {}
+            for c, values in misfits.items():
+                new = values - accepted[c]
+                if new:
+                    kind = kinds[c][0]
+                    widened[c] = (
+                        kind,
+                        _widen_kind(kind, new, held.get(c, frozenset())),
+                    )
+            if widened:
+                raise _ColumnsWidened(
+                    kinds | {c: (new, None) for c, (_, new) in widened.items()},
+                    widened,
                 )
+
+        # Add partition col (typed, so an empty frame still maps to a Glue type)
+        df["extraction_timestamp"] = pd.Series(
+            extraction_timestamp, index=df.index, dtype="string"
+        )
+        yield df
+
+
+def _athena_to_arrow(athena_type: str) -> pa.DataType:
+    t = athena_type.lower().replace(" ", "")
+    if t.startswith(("varchar", "char")):
+        return pa.string()
+    m = re.fullmatch(r"decimal\((\d+),(\d+)\)", t)
+    if m:
+        return pa.decimal128(int(m[1]), int(m[2]))
+    try:
+        return _ATHENA_TO_ARROW[t]
+    except KeyError:
+        raise ValueError(f"Unsupported Glue column type '{athena_type}'") from None
+
+
+def _align_to_table_types(schema: pa.Schema, table_types: dict[str, str]) -> pa.Schema:
+    """
+    Schema to write into an existing Glue table: columns it already has take
+    its types, so every partition stays readable by Athena (create_parquet_table
+    in append mode refuses to change them). New columns keep their inferred type.
+    """
+    return pa.schema(
+        [
+            (
+                field.with_type(_athena_to_arrow(table_types[field.name]))
+                if field.name in table_types
+                else field
+            )
+            for field in schema
+        ]
+    )
+
+
+def _cast_to_schema(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Cast table to schema column by column, naming any column that won't cast."""
+    for i, field in enumerate(schema):
+        col = table.column(i)
+        if col.type == field.type:
             continue
+        try:
+            table = table.set_column(i, field, col.cast(field.type))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(
+                f"Column '{field.name}' is {col.type} in this CSV but {field.type} "
+                f"in the existing Glue table, and can't be cast: {e}"
+            ) from e
+    return table.replace_schema_metadata(schema.metadata)
 
-        df[c] = col.astype("string")
 
-    return df
+def _write_parquet_dataset(
+    frames: Iterator[pd.DataFrame],
+    *,
+    schema: pa.Schema,
+    bucket: str,
+    table_prefix: str,
+    extraction_timestamp: str,
+    run_id: str,
+    replace_partition: bool = False,
+    cast_to: pa.Schema | None = None,
+) -> int:
+    """
+    Stream frames as a hive-partitioned (extraction_timestamp) parquet dataset
+    under s3://bucket/table_prefix with pyarrow.dataset, bypassing awswrangler.
+    Files are named after run_id (see _delete_run_files).
+    With replace_partition, existing files in the written partition are
+    deleted first (existing_data_behavior="delete_matching").
+    With cast_to (same columns as schema), each block is cast to it first.
+    If writing fails partway, the files this call wrote are deleted again.
+    Returns the number of rows written.
+    """
+    base_dir = f"{bucket}/{table_prefix.rstrip('/')}"
+    rows = 0
+
+    def batches():
+        nonlocal rows
+        for df in frames:
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if cast_to is not None:
+                table = _cast_to_schema(table, cast_to)
+            rows += table.num_rows
+            yield from table.to_batches()
+
+    file_format = ds.ParquetFileFormat()
+    try:
+        ds.write_dataset(
+            batches(),
+            schema=cast_to or schema,
+            base_dir=base_dir,
+            format=file_format,
+            # Athena can't read nanosecond timestamps
+            file_options=file_format.make_write_options(
+                compression="snappy",
+                coerce_timestamps="ms",
+                allow_truncated_timestamps=True,
+            ),
+            partitioning=ds.partitioning(
+                pa.schema([("extraction_timestamp", pa.string())]), flavor="hive"
+            ),
+            filesystem=_PA_FS,
+            basename_template=f"{run_id}-{{i}}.snappy.parquet",
+            existing_data_behavior=(
+                "delete_matching" if replace_partition else "overwrite_or_ignore"
+            ),
+            max_rows_per_file=PARQUET_MAX_ROWS_PER_FILE,
+            max_rows_per_group=PARQUET_MAX_ROWS_PER_FILE,
+        )
+    except Exception:
+        # Leave no half-written upload in the partition
+        _delete_run_files(
+            bucket=bucket,
+            table_prefix=table_prefix,
+            extraction_timestamp=extraction_timestamp,
+            run_id=run_id,
+        )
+        raise
+    return rows
+
+
+def _delete_run_files(
+    *, bucket: str, table_prefix: str, extraction_timestamp: str, run_id: str
+):
+    """Delete the parquet files one _write_parquet_dataset call wrote."""
+    selector = pa_fs.FileSelector(
+        f"{bucket}/{table_prefix}extraction_timestamp={extraction_timestamp}",
+        allow_not_found=True,
+    )
+    for info in _PA_FS.get_file_info(selector):
+        if info.base_name.startswith(run_id):
+            _PA_FS.delete_file(info.path)
+
+
+def _register_partition(
+    df: pd.DataFrame,
+    *,
+    database: str,
+    table: str,
+    dataset_root: str,
+    extraction_timestamp: str,
+    table_types: dict[str, str] | None = None,
+):
+    """
+    Create or evolve the Glue table from df's dtypes, then add the partition.
+    Columns in table_types (an existing table's, which the data was cast to)
+    keep those types.
+    Metadata-only; the parquet files are written by _write_parquet_dataset.
+    """
+    columns_types, partitions_types = wr.catalog.extract_athena_types(
+        df, index=False, partition_cols=["extraction_timestamp"]
+    )
+    if table_types:
+        columns_types = {c: table_types.get(c, t) for c, t in columns_types.items()}
+        partitions_types = {
+            c: table_types.get(c, t) for c, t in partitions_types.items()
+        }
+    # mode="append" adds new columns to an existing table (schema evolution)
+    # and raises if an existing column's type would change
+    wr.catalog.create_parquet_table(
+        database=database,
+        table=table,
+        path=dataset_root,
+        columns_types=columns_types,
+        partitions_types=partitions_types,
+        compression="snappy",
+        mode="append",
+    )
+    wr.catalog.add_parquet_partitions(
+        database=database,
+        table=table,
+        partitions_values={
+            f"{dataset_root}extraction_timestamp={extraction_timestamp}/": [
+                extraction_timestamp
+            ]
+        },
+        compression="snappy",
+    )
+
+
+def _load_csv_partition(
+    *,
+    csv_bucket: str,
+    csv_key: str,
+    encoding: str | None,
+    out_bucket: str,
+    table_prefix: str,
+    extraction_timestamp: str,
+    replace_partition: bool = False,
+    table_types: Callable[[], dict[str, str] | None] = lambda: None,
+) -> tuple[int, pd.DataFrame, str]:
+    """
+    Convert s3://csv_bucket/csv_key into one parquet partition under
+    s3://out_bucket/table_prefix, block by block.
+    Column kinds come from the first block; if a later one doesn't fit them,
+    or doesn't decode (and encoding wasn't given), the partition is rewritten
+    from the start with the widened kinds or the next fallback encoding.
+    table_types is called once the first block is typed, before anything is
+    written: an existing Glue table's types to cast to, or None.
+    Returns the rows written, an empty frame with the final dtypes (all the
+    catalog needs) and the run_id naming the files.
+    """
+    input_path = f"s3://{csv_bucket}/{csv_key}"
+    dataset_root = f"s3://{out_bucket}/{table_prefix}"
+    kinds = None
+    attempt_encoding = encoding
+    while True:
+        # Names this attempt's files, so they can be found to delete
+        run_id = uuid.uuid4().hex
+        logger.info(
+            f"Reading CSV from {input_path} with encoding {attempt_encoding or 'auto-detect'}"
+        )
+        try:
+            with open_csv_safely(
+                csv_bucket, csv_key, explicit_encoding=attempt_encoding
+            ) as blocks:
+                frames = _typed_frames(blocks, extraction_timestamp, kinds)
+                first = next(frames)
+                schema = pa.Schema.from_pandas(first, preserve_index=False)
+                typed_empty = first.head(0)
+                logger.debug(f"Columns after cleanup: {first.columns.tolist()}")
+
+                existing = table_types()
+                cast_to = _align_to_table_types(schema, existing) if existing else None
+
+                logger.info(
+                    f"Writing Parquet to {dataset_root} with partition extraction_timestamp={extraction_timestamp}"
+                )
+                frames = itertools.chain([first], frames)
+                del first  # let the first block go once it's written
+
+                rows = _write_parquet_dataset(
+                    frames,
+                    schema=schema,
+                    bucket=out_bucket,
+                    table_prefix=table_prefix,
+                    extraction_timestamp=extraction_timestamp,
+                    run_id=run_id,
+                    replace_partition=replace_partition,
+                    cast_to=cast_to,
+                )
+            return rows, typed_empty, run_id
+        except _ColumnsWidened as e:
+            logger.warning(f"{e}; rewriting the partition")
+            kinds = e.kinds
+        except _DecodeFailed as e:
+            attempt_encoding = None if encoding else _next_fallback_encoding(e.encoding)
+            if attempt_encoding is None:
+                raise
+            logger.warning(f"{e}; rewriting the partition as {attempt_encoding}")
+            kinds = None  # non-ASCII column names decode differently too
 
 
 def move_to_raw_history(
@@ -279,10 +1188,18 @@ def handler(event, context):
       "name": "concept",
       "load_mode": "incremental" | "overwrite",
     }
+    or, for the state machine's follow-up step after an overwrite,
+    {"delete_prefix": <the "delete_prefix" this handler returned>}
     """
     try:
         logger.info(f"Received event: {event}")
 
+        if "delete_prefix" in event:
+            return _delete_stale_data(event["delete_prefix"])
+
+        # Anything older than this under the table prefix is stale on overwrite
+        started_at = datetime.now(timezone.utc)
+
         csv_bucket = event["csv_upload_bucket"]
         csv_key = event["csv_upload_key"]
         out_bucket = event["output_bucket"]
@@ -303,63 +1220,84 @@ def handler(event, context):
             f"-> table={table_name}, db={glue_db}, mode={load_mode}, dest={dataset_root}"
         )
 
-        # Ensure Glue database exists
-        ensure_database(glue_db)
-        logger.debug(f"Ensured Glue database: {glue_db}")
-
-        if load_mode == "overwrite":
-            logger.info(
-                f"Load mode: Overwrite. Overwriting existing dataset at {dataset_root}"
-            )
-
-            _delete_prefix(out_bucket, table_prefix)
-            wr.catalog.delete_table_if_exists(database=glue_db, table=table_name)
-
-        elif load_mode != "incremental":
-            logger.info(
-                f"Load mode: Incremental. Retaining existing dataset at {dataset_root}"
-            )
-
-        else:
+        if load_mode not in ("incremental", "overwrite"):
             raise ValueError("load_mode must be 'incremental' or 'overwrite'")
 
-        # Read CSV
-        logger.info(
-            f"Reading CSV from {input_path} with encodings {forced_encoding or 'auto-detect'}"
-        )
-
-        df = read_csv_safely(input_path, explicit_encoding=forced_encoding)
-
-        logger.info(
-            f"Loaded DataFrame with {len(df)} rows and {len(df.columns)} columns"
-        )
-
-        # Clean + normalize
-        df = _clean_nbsp_and_strip(df)
-        df = _deduplicate_columns(df)
-        df = _stabilize_dtypes(df)
-        logger.debug(f"Columns after cleanup: {df.columns.tolist()}")
+        # The Glue control-plane calls don't depend on the CSV, so run them
+        # while the first block is read and typed.
+        with ThreadPoolExecutor(max_workers=2) as ex:
+            # Ensure Glue database exists
+            f_db = ex.submit(ensure_database, glue_db)
+
+            overwrite = load_mode == "overwrite"
+            f_types = None
+            if overwrite:
+                logger.info(
+                    f"Load mode: Overwrite. Overwriting existing dataset at {dataset_root}"
+                )
+            else:
+                logger.info(
+                    f"Load mode: Incremental. Retaining existing dataset at {dataset_root}"
+                )
+                # None if the table doesn't exist yet
+                f_types = ex.submit(
+                    wr.catalog.get_table_types, database=glue_db, table=table_name
+                )
 
-        # Add partition col
-        df["extraction_timestamp"] = extraction_timestamp
+            def existing_types() -> dict[str, str] | None:
+                f_db.result()
+                logger.debug(f"Ensured Glue database: {glue_db}")
+                return f_types.result() if f_types else None
+
+            rows, typed_empty, run_id = _load_csv_partition(
+                csv_bucket=csv_bucket,
+                csv_key=csv_key,
+                encoding=forced_encoding,
+                out_bucket=out_bucket,
+                table_prefix=table_prefix,
+                extraction_timestamp=extraction_timestamp,
+                replace_partition=overwrite,
+                table_types=existing_types,
+            )
+            table_types = f_types.result() if f_types else None
 
-        # Write parquet
+        try:
+            if overwrite:
+                # Dropped only once the new data is written, so a failed load
+                # leaves the old table in place. Old partitions are removed by
+                # a later state machine step.
+                wr.catalog.delete_table_if_exists(database=glue_db, table=table_name)
+
+            _register_partition(
+                typed_empty,
+                database=glue_db,
+                table=table_name,
+                dataset_root=dataset_root,
+                extraction_timestamp=extraction_timestamp,
+                table_types=table_types,
+            )
+        except Exception:
+            # Leave no files behind that the catalog doesn't describe
+            _delete_run_files(
+                bucket=out_bucket,
+                table_prefix=table_prefix,
+                extraction_timestamp=extraction_timestamp,
+                run_id=run_id,
+            )
+            raise
         logger.info(
-            f"Writing Parquet to {dataset_root} with partition extraction_timestamp={extraction_timestamp}"
+            f"Successfully wrote {rows} records to Glue table {glue_db}.{table_name}"
         )
 
-        wr.s3.to_parquet(
-            df=df,
-            path=dataset_root,
-            dataset=True,
-            partition_cols=["extraction_timestamp"],
-            database=glue_db,
-            table=table_name,
-            schema_evolution=True,
-        )
-        logger.info(
-            f"Successfully wrote {len(df)} records to Glue table {glue_db}.{table_name}"
-        )
+        delete_prefix = None
+        if overwrite:
+            delete_prefix = {
+                "bucket": out_bucket,
+                "prefix": table_prefix,
+                "keep_prefix": f"{table_prefix}extraction_timestamp={extraction_timestamp}/",
+                "created_before": started_at.isoformat(),
+            }
+        return {"table": f"{glue_db}.{table_name}", "delete_prefix": delete_prefix}
 
     except Exception as e:
         logger.exception(f"Error converting CSV to Parquet: {str(e)}")
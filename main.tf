@@ -39,6 +39,18 @@ data "aws_iam_policy_document" "csv_to_parquet_lambda_function" {
     resources = ["*"]
   }
 
+  statement {
+    sid       = "S3BatchOperationsCreateJob"
+    actions   = ["s3:CreateJob"]
+    resources = ["*"]
+  }
+
+  statement {
+    sid       = "PassS3BatchOperationsRole"
+    actions   = ["iam:PassRole"]
+    resources = [aws_iam_role.s3_batch_operations.arn]
+  }
+
   statement {
     sid       = "Logs"
     actions   = ["logs:CreateLogGroup", "logs:CreateLogStream", "logs:PutLogEvents"]
@@ -65,6 +77,9 @@ module "csv-to-parquet-export" {
     GLUE_DATABASE = var.name
     LOAD_MODE     = var.load_mode
     TABLE_NAMING  = var.table_naming
+
+    ACCOUNT_ID                = data.aws_caller_identity.current.account_id
+    BATCH_OPERATIONS_ROLE_ARN = aws_iam_role.s3_batch_operations.arn
   }
 
   source_path = [{
@@ -106,6 +106,17 @@ module "s3_concept_data_output_bucket" {
       ]
 
       noncurrent_version_expiration = { days = 730 }
+    },
+    {
+      # Objects tagged by the csv-to-parquet S3 Batch Operations job when
+      # overwriting a large table (see EXPIRE_TAG_KEY in the lambda)
+      id      = "expire-overwritten"
+      enabled = "Enabled"
+      filter  = { tags = { "csv-to-parquet-expired" = "true" } }
+
+      expiration = {
+        days = 1
+      }
     }
   ]
 
@@ -6,5 +6,6 @@ resource "aws_sfn_state_machine" "csv_to_parquet_export" {
 
   definition = templatefile("${path.module}/state_machine.asl.json.tpl", {
     lambda_arn = module.csv-to-parquet-export.lambda_function_arn
+    account_id = data.aws_caller_identity.current.account_id
   })
 }
@@ -10,7 +10,89 @@
         "Payload.$": "$"
       },
       "OutputPath": "$.Payload",
-      "End": true
+      "Next": "HasStaleData"
+    },
+    "HasStaleData": {
+      "Type": "Choice",
+      "Choices": [
+        {
+          "And": [
+            { "Variable": "$.delete_prefix", "IsPresent": true },
+            { "Variable": "$.delete_prefix", "IsNull": false }
+          ],
+          "Next": "DeleteStaleData"
+        }
+      ],
+      "Default": "Done"
+    },
+    "DeleteStaleData": {
+      "Type": "Task",
+      "Resource": "arn:aws:states:::lambda:invoke",
+      "Parameters": {
+        "FunctionName": "${lambda_arn}",
+        "Payload": {
+          "delete_prefix.$": "$.delete_prefix"
+        }
+      },
+      "OutputPath": "$.Payload",
+      "Next": "DeleteJobSubmitted"
+    },
+    "DeleteJobSubmitted": {
+      "Type": "Choice",
+      "Choices": [
+        {
+          "And": [
+            { "Variable": "$.delete_job_id", "IsPresent": true },
+            { "Variable": "$.delete_job_id", "IsNull": false }
+          ],
+          "Next": "WaitForDeleteJob"
+        }
+      ],
+      "Default": "Done"
+    },
+    "WaitForDeleteJob": {
+      "Type": "Wait",
+      "Seconds": 30,
+      "Next": "DescribeDeleteJob"
+    },
+    "DescribeDeleteJob": {
+      "Type": "Task",
+      "Resource": "arn:aws:states:::aws-sdk:s3control:describeJob",
+      "Parameters": {
+        "AccountId": "${account_id}",
+        "JobId.$": "$.delete_job_id"
+      },
+      "ResultSelector": {
+        "status.$": "$.Job.Status"
+      },
+      "ResultPath": "$.delete_job",
+      "Next": "DeleteJobStatus"
+    },
+    "DeleteJobStatus": {
+      "Type": "Choice",
+      "Choices": [
+        {
+          "Variable": "$.delete_job.status",
+          "StringEquals": "Complete",
+          "Next": "Done"
+        },
+        {
+          "Or": [
+            { "Variable": "$.delete_job.status", "StringEquals": "Failed" },
+            { "Variable": "$.delete_job.status", "StringEquals": "Cancelled" }
+          ],
+          "Next": "DeleteJobFailed"
+        }
+      ],
+      "Default": "WaitForDeleteJob"
+    },
+    "DeleteJobFailed": {
+      "Type": "Fail",
+      "Error": "DeleteJobFailed",
+      "Cause": "S3 Batch Operations job tagging the previous dataset for expiry did not complete"
+    },
+    "Done": {
+      "Type": "Succeed"
     }
   }
 }
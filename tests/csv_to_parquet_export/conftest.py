@@ -0,0 +1,47 @@
+"""
+Load lambda-functions/csv-to-parquet-export/main.py with its S3 access pointed
+at the local filesystem, so the load path runs without AWS.
+"""
+
+import importlib.util
+import os
+import pathlib
+
+import pyarrow.fs as pa_fs
+import pytest
+
+# The boto3 and pyarrow S3 clients are created at import and need a region;
+# the tests never call them.
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-2")
+os.environ.setdefault("AWS_REGION", "eu-west-2")
+
+MAIN = (
+    pathlib.Path(__file__).parents[2]
+    / "lambda-functions"
+    / "csv-to-parquet-export"
+    / "main.py"
+)
+
+_spec = importlib.util.spec_from_file_location("csv_to_parquet_export", MAIN)
+export = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(export)
+
+
+@pytest.fixture
+def main(monkeypatch):
+    """
+    The module with "buckets" as local directories, and blocks, samples and
+    files small enough that a few thousand rows span several of each.
+    """
+    monkeypatch.setattr(export, "_PA_FS", pa_fs.LocalFileSystem())
+    monkeypatch.setattr(
+        export,
+        "_read_sample",
+        lambda bucket, key: (pathlib.Path(bucket) / key).read_bytes()[
+            : export.SNIFF_SAMPLE_BYTES
+        ],
+    )
+    monkeypatch.setattr(export, "SNIFF_SAMPLE_BYTES", 1024)
+    monkeypatch.setattr(export, "CSV_BLOCK_SIZE", 4 << 10)
+    monkeypatch.setattr(export, "PARQUET_MAX_ROWS_PER_FILE", 500)
+    return export
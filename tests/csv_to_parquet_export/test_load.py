@@ -0,0 +1,205 @@
+import itertools
+import pathlib
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pytest
+
+TS = "20250902103213Z"
+
+
+def _write_csv(directory: pathlib.Path, body: str, encoding: str = "utf-8") -> str:
+    (directory / "in.csv").write_bytes(body.encode(encoding))
+    return "in.csv"
+
+
+def _load(main, directory: pathlib.Path, encoding: str | None = None, **kwargs):
+    return main._load_csv_partition(
+        csv_bucket=str(directory),
+        csv_key="in.csv",
+        encoding=encoding,
+        out_bucket=str(directory),
+        table_prefix="out/",
+        extraction_timestamp=TS,
+        **kwargs,
+    )
+
+
+def _files(directory: pathlib.Path) -> list[pathlib.Path]:
+    return sorted((directory / "out").glob("*/*"))
+
+
+def _read_back(directory: pathlib.Path) -> pa.Table:
+    return ds.dataset(directory / "out", partitioning="hive").to_table()
+
+
+def _blocks(main, directory: pathlib.Path) -> list:
+    with main.open_csv_safely(str(directory), "in.csv") as blocks:
+        return list(main._typed_frames(blocks, TS))
+
+
+def test_streams_blocks_into_one_typed_partition(main, tmp_path):
+    n = 3000
+    _write_csv(
+        tmp_path,
+        "id,amount,opened,active,na,name\n"
+        + "".join(
+            f'{i},"{i},000.50",0{i % 9 + 1}/02/2024,{"yes" if i % 2 else "no"},'
+            f'{"N/A" if i % 50 == 0 else i},name {i}\n'
+            for i in range(n)
+        ),
+    )
+
+    assert len(_blocks(main, tmp_path)) > 1
+
+    rows, typed_empty, run_id = _load(main, tmp_path)
+
+    assert rows == n
+    assert typed_empty.empty
+    files = _files(tmp_path)
+    assert len(files) == -(-n // main.PARQUET_MAX_ROWS_PER_FILE)
+    assert all(f.parent.name == f"extraction_timestamp={TS}" for f in files)
+    assert all(f.name.startswith(run_id) for f in files)
+
+    table = _read_back(tmp_path)
+    assert table.num_rows == n
+    assert table.schema.field("id").type == pa.int64()
+    assert table.schema.field("amount").type == pa.float64()
+    assert table.schema.field("opened").type == pa.timestamp("ms")
+    assert table.schema.field("active").type == pa.bool_()
+    assert table.schema.field("na").type == pa.int64()
+    assert table.schema.field("name").type == pa.string()
+    assert table.column("na").null_count == n // 50
+    assert sorted(table.column("id").to_pylist()) == list(range(n))
+
+
+def test_quoted_newlines_span_blocks(main, tmp_path):
+    n = 500
+    _write_csv(
+        tmp_path,
+        "id,note\n" + "".join(f'{i},"line one\nline two {i}"\n' for i in range(n)),
+    )
+
+    rows, _, _ = _load(main, tmp_path)
+
+    assert rows == n
+    notes = _read_back(tmp_path).column("note").to_pylist()
+    assert all(note.startswith("line one\nline two ") for note in notes)
+
+
+def test_short_rows_are_padded_and_long_rows_skipped(main, tmp_path):
+    _write_csv(tmp_path, "a,b,c\n1,2,3\n4,5\n6,7,8,9\n10,11,12\n")
+
+    rows, _, _ = _load(main, tmp_path)
+
+    assert rows == 3
+    table = _read_back(tmp_path).sort_by("a")
+    assert table.column("a").to_pylist() == [1, 4, 10]
+    assert table.column("c").to_pylist() == [3, None, 12]
+
+
+def test_bom_is_not_part_of_the_first_column_name(main, tmp_path):
+    _write_csv(tmp_path, "\ufeffid,name\n1,x\n")
+
+    _load(main, tmp_path, encoding="utf-8")
+
+    assert _read_back(tmp_path).column_names[:2] == ["id", "name"]
+
+
+@pytest.mark.parametrize(
+    "column, first, late, expected",
+    [
+        ("flag", lambda i: str(i % 2), "2", pa.int64()),
+        ("flag", lambda i: str(i % 2), "0.5", pa.float64()),
+        ("flag", lambda i: "yes" if i % 2 else "no", "maybe", pa.string()),
+        ("count", str, "2.5", pa.float64()),
+        ("count", str, "many", pa.string()),
+        ("when", lambda i: "01/02/2024", "2024-02-03T10:00", pa.string()),
+    ],
+)
+def test_late_misfit_rewrites_with_widened_type(
+    main, tmp_path, column, first, late, expected
+):
+    n = 2000
+    values = [first(i) for i in range(n - 1)] + [late]
+    _write_csv(
+        tmp_path, f"id,{column}\n" + "".join(f"{i},{v}\n" for i, v in enumerate(values))
+    )
+
+    rows, _, run_id = _load(main, tmp_path)
+
+    assert rows == n
+    # Only the rewrite's files are left
+    assert all(f.name.startswith(run_id) for f in _files(tmp_path))
+    table = _read_back(tmp_path)
+    assert table.num_rows == n
+    assert table.schema.field(column).type == expected
+    late_value = table.sort_by("id").column(column)[-1].as_py()
+    assert late_value is not None
+    assert str(late_value) == late
+
+
+def test_widening_deletes_the_files_already_written(main, tmp_path):
+    n = 2000
+    _write_csv(
+        tmp_path,
+        "id,count\n"
+        + "".join(f"{i},{'many' if i == n - 1 else i}\n" for i in range(n)),
+    )
+
+    with pytest.raises(main._ColumnsWidened):
+        with main.open_csv_safely(str(tmp_path), "in.csv") as blocks:
+            frames = main._typed_frames(blocks, TS)
+            first = next(frames)
+            main._write_parquet_dataset(
+                itertools.chain([first], frames),
+                schema=pa.Schema.from_pandas(first, preserve_index=False),
+                bucket=str(tmp_path),
+                table_prefix="out/",
+                extraction_timestamp=TS,
+                run_id="run",
+            )
+
+    assert _files(tmp_path) == []
+
+
+def test_late_undecodable_byte_falls_back_to_cp1252(main, tmp_path):
+    n = 3000
+    _write_csv(
+        tmp_path,
+        "id,note\n" + "".join(f"{i},plain\n" for i in range(n)) + f"{n},€5 ’quote’\n",
+        encoding="cp1252",
+    )
+    # The sample sniffed is all ASCII, so the read starts as utf-8
+    assert (tmp_path / "in.csv").read_bytes()[: main.SNIFF_SAMPLE_BYTES].isascii()
+
+    rows, _, run_id = _load(main, tmp_path)
+
+    assert rows == n + 1
+    assert all(f.name.startswith(run_id) for f in _files(tmp_path))
+    notes = _read_back(tmp_path).column("note").to_pylist()
+    assert [v for v in notes if v != "plain"] == ["€5 ’quote’"]
+
+
+def test_explicit_encoding_is_not_overridden(main, tmp_path):
+    n = 3000
+    _write_csv(
+        tmp_path,
+        "id,note\n" + "".join(f"{i},plain\n" for i in range(n)) + f"{n},€5\n",
+        encoding="cp1252",
+    )
+
+    with pytest.raises(main._DecodeFailed):
+        _load(main, tmp_path, encoding="utf-8")
+
+    assert _files(tmp_path) == []
+
+
+def test_existing_table_types_are_cast_to(main, tmp_path):
+    _write_csv(tmp_path, "id,amount\n1,2\n3,4\n")
+
+    _load(main, tmp_path, table_types=lambda: {"id": "string", "amount": "double"})
+
+    schema = _read_back(tmp_path).schema
+    assert schema.field("id").type == pa.string()
+    assert schema.field("amount").type == pa.float64()